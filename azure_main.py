@@ -1,77 +1,237 @@
-import os
-from datetime import datetime, timedelta
-from typing import Optional
+import asyncio
+import hashlib
+import secrets
+from contextlib import asynccontextmanager
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
 
 from fastapi import FastAPI, Depends, HTTPException, status, Request
-from fastapi.responses import RedirectResponse, HTMLResponse
-from fastapi.security import OAuth2PasswordBearer
-from starlette.middleware.sessions import SessionMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse
+from fastapi.security import APIKeyCookie, OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
 from authlib.integrations.starlette_client import OAuth
-from jose import jwt, JWSAlgorithms
+from cachetools import TLRUCache, TTLCache
+import httpx
+import jwt
+import orjson
+from pydantic import BaseModel, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
-from dotenv import load_dotenv
+from signing import FastSessionMiddleware, b64url, hs256
+from static_files import CachedStaticFiles
 
 # --- Azure AD specific imports ---
-from fastapi_microsoft_identity import initialize, requires_auth, AuthError, validate_scope
+from jwt import PyJWKClient, PyJWKClientError
 
-load_dotenv()
+# --- Configuration (Google part already defined above) ---
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore", frozen=True)
+
+    google_client_id: str = Field(min_length=1)
+    google_client_secret: str = Field(min_length=1)
+    jwt_secret_key: str = Field(min_length=32)
+    session_secret_key: str = Field(default="another-secret-key", min_length=1)
+    access_token_expire: timedelta = timedelta(minutes=30)
+    # --- Azure AD ---
+    azure_tenant_id: Optional[str] = None
+    azure_client_id: Optional[str] = None # Client ID of your API app registration in Azure AD
+    azure_scope: str = "api://YOUR_AZURE_API_APP_ID/access_as_user" # This should be the scope you defined in Azure AD for your API
+
+settings = Settings()
 
-# --- Configuration for Google OAuth (already defined above) ---
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 GOOGLE_REDIRECT_URI = "http://localhost:8000/auth/google/callback"
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-super-secret-key")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+_DEFAULT_EXPIRY = timedelta(minutes=15)
+_ACCESS_EXPIRY = settings.access_token_expire
 
-# --- Configuration for Azure AD ---
-AZURE_TENANT_ID = os.getenv("AZURE_TENANT_ID")
-AZURE_CLIENT_ID = os.getenv("AZURE_CLIENT_ID") # Client ID of your API app registration in Azure AD
-AZURE_SCOPE = os.getenv("AZURE_SCOPE", "api://YOUR_AZURE_API_APP_ID/access_as_user") # This should be the scope you defined in Azure AD for your API
-
-# Initialize fastapi-microsoft-identity
+# Azure AD signing keys (JWKS)
 # Note: This is for validating tokens that *clients* send to your API.
 # If your FastAPI app also acts as a client to Azure AD to get tokens for *itself*
 # (e.g., if you were to implement a full user login flow initiated by FastAPI redirecting to Azure),
 # you'd use Authlib's OAuth.register for 'microsoft' similar to 'google'.
 # For now, we're focusing on FastAPI *validating* tokens issued by Azure AD.
-try:
-    initialize(tenant_id=AZURE_TENANT_ID, client_id=AZURE_CLIENT_ID)
-except ValueError as e:
-    print(f"Warning: Azure AD initialization failed. Ensure AZURE_TENANT_ID and AZURE_CLIENT_ID are set. Error: {e}")
+# The key set is fetched once and reused for an hour, so validating a token is a local
+# signature check. A token signed with an unknown "kid" triggers one refresh of the set
+# (PyJWKClient.get_signing_key) before it is rejected.
+if not (settings.azure_tenant_id and settings.azure_client_id):
+    print("Warning: Azure AD is not configured. Ensure AZURE_TENANT_ID and AZURE_CLIENT_ID are set.")
+
+AZURE_JWKS_URL = f"https://login.microsoftonline.com/{settings.azure_tenant_id}/discovery/v2.0/keys"
+# (issuer, audience) expected for each access token version ("ver" claim): v2.0 tokens
+# carry the client ID as audience, v1.0 tokens use the Application ID URI
+AZURE_TOKEN_VERSIONS = {
+    "1.0": (f"https://sts.windows.net/{settings.azure_tenant_id}/", f"api://{settings.azure_client_id}"),
+    "2.0": (f"https://login.microsoftonline.com/{settings.azure_tenant_id}/v2.0", settings.azure_client_id),
+}
+
+_jwks_client = PyJWKClient(AZURE_JWKS_URL, cache_keys=True, lifespan=3600)
 
 
 # --- FastAPI App Setup (already defined above) ---
+async def _prime_google_metadata():
+    # Authlib keeps the OpenID configuration and signing keys for the life of the process
+    # once loaded, so fetching them here takes the discovery round-trip off the first login.
+    try:
+        await oauth.google.load_server_metadata()
+        await oauth.google.fetch_jwk_set()
+    except Exception as e:
+        print(f"Warning: could not preload Google OpenID metadata, it will be fetched on first login. Error: {e}")
+
+def _prime_azure_jwks():
+    # PyJWKClient fetches with blocking urllib, so this runs in the threadpool
+    if not (settings.azure_tenant_id and settings.azure_client_id):
+        return
+    try:
+        _jwks_client.get_signing_keys()
+    except PyJWKClientError as e:
+        print(f"Warning: could not preload Azure AD signing keys, they will be fetched on first request. Error: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.http_transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+    await asyncio.gather(_prime_google_metadata(), run_in_threadpool(_prime_azure_jwks))
+    yield
+    await app.state.http_transport.aclose()
+
 app = FastAPI(
     title="FastAPI OAuth Integrations",
     description="Example for Google and Azure AD authentication",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
-app.add_middleware(SessionMiddleware, secret_key=os.getenv("SESSION_SECRET_KEY", "another-secret-key"))
+app.add_middleware(FastSessionMiddleware, secret_key=settings.session_secret_key, max_age=600)
+
+class AppTransport(httpx.AsyncBaseTransport):
+    """
+    Sends requests through the app-wide HTTP/2 connection pool in app.state.http_transport.
+    Authlib opens and closes a client for every OAuth call; closing this transport is a no-op,
+    so TLS sessions and keep-alive connections survive across logins.
+    """
+    def __init__(self, app: FastAPI):
+        self.app = app
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.app.state.http_transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
 
 oauth = OAuth()
 oauth.register(
     name='google',
-    client_id=GOOGLE_CLIENT_ID,
-    client_secret=GOOGLE_CLIENT_SECRET,
+    client_id=settings.google_client_id,
+    client_secret=settings.google_client_secret,
     server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={'scope': 'openid email profile'},
+    client_kwargs={'scope': 'openid email profile', 'transport': AppTransport(app), 'timeout': 5.0},
 )
 
 # --- Internal JWT for authenticated users (already defined above) ---
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
+# Browsers authenticate with the session_id cookie, API callers with an internal JWT bearer token
+session_cookie = APIKeyCookie(name="session_id", auto_error=False)
+internal_bearer = HTTPBearer(scheme_name="InternalBearer", auto_error=False)
+
+# The header of every internal token is the same, so it is serialized and encoded once
+_JWT_HEADER_B64 = b64url(b'{"alg":"HS256","typ":"JWT"}')
+
+def create_access_token(*, sub: str, email: str, name: str, expires_delta: timedelta = _DEFAULT_EXPIRY) -> str:
+    expire = datetime.now(timezone.utc) + expires_delta
+    payload = {"sub": sub, "email": email, "name": name, "exp": int(expire.timestamp())}
+    # Equivalent to jwt.encode, without re-serializing the constant header on every token
+    signing_input = _JWT_HEADER_B64 + b"." + b64url(orjson.dumps(payload))
+    signature = hs256.sign(signing_input, hs256.prepare_key(settings.jwt_secret_key))
+    return (signing_input + b"." + b64url(signature)).decode("ascii")
+
+# --- Server-side sessions ---
+# Browsers get an opaque session_id cookie that maps to the user in this in-process cache,
+# so authenticating a page load is a dict lookup with no token to verify. Run a single
+# worker, or move the cache to a shared store such as Redis, if you scale out.
+_sessions = TTLCache(maxsize=10_000, ttl=_ACCESS_EXPIRY.total_seconds())
+_sessions_lock = threading.Lock()
+
+def create_session(user_data: dict) -> str:
+    session_id = secrets.token_urlsafe(32)
+    with _sessions_lock:
+        _sessions[session_id] = {**user_data, "exp": int(time.time() + _ACCESS_EXPIRY.total_seconds())}
+    return session_id
+
+# --- Verified token cache ---
+# Decoded payloads are kept for repeat requests, keyed by a SHA-256 prefix of the token
+# so raw tokens never sit in memory. Internal JWTs and Azure AD claims live in separate
+# caches, so a token verified by one path is never accepted by the other. Entries live
+# no longer than the token's own "exp" claim, and at most TOKEN_CACHE_MAX_TTL seconds.
+TOKEN_CACHE_MAX_TTL = 60
+
+def _token_cache_ttu(_key, payload, now):
+    return min(payload.get("exp", now), now + TOKEN_CACHE_MAX_TTL)
+
+# Locks are needed because sync dependencies run in the threadpool
+_internal_token_cache = TLRUCache(maxsize=10000, ttu=_token_cache_ttu, timer=time.time)
+_internal_token_cache_lock = threading.Lock()
+_azure_claims_cache = TLRUCache(maxsize=10000, ttu=_token_cache_ttu, timer=time.time)
+_azure_claims_cache_lock = threading.Lock()
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(datetime.timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(datetime.timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+def _token_cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+def decode_access_token(access_token: str) -> dict:
+    key = _token_cache_key(access_token)
+    with _internal_token_cache_lock:
+        payload = _internal_token_cache.get(key)
+    if payload is None:
+        payload = jwt.decode(access_token, settings.jwt_secret_key, algorithms=[ALGORITHM])
+        with _internal_token_cache_lock:
+            _internal_token_cache[key] = payload
+    return payload
+
+def get_current_user(
+    session_id: Optional[str] = Depends(session_cookie),
+    bearer: Optional[HTTPAuthorizationCredentials] = Depends(internal_bearer),
+) -> dict:
+    """
+    Resolves the user from the session_id cookie, or from an internal JWT sent as
+    "Authorization: Bearer" by API-style callers.
+    FastAPI caches dependency results per request, so every dependant shares one lookup.
+    """
+    if session_id:
+        with _sessions_lock:
+            user = _sessions.get(session_id)
+        if user is not None:
+            return user
+    if bearer is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+    try:
+        payload = decode_access_token(bearer.credentials)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    return payload
+
+# --- Response models ---
+# Declaring return types lets FastAPI serialize responses straight to JSON bytes with
+# pydantic-core instead of going through jsonable_encoder and the stdlib json module.
+class AccessToken(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+
+class GoogleProtectedData(BaseModel):
+    message: str
+    google_id: Optional[str] = None
+
+class AzureProtectedData(BaseModel):
+    message: str
+    tenant_id: str
+    claims: Dict[str, Any] # For debugging, shows all claims
 
 # --- Google OAuth Endpoints (already defined above) ---
 @app.get("/auth/google/login")
@@ -88,88 +248,106 @@ async def auth_google_callback(request: Request):
             detail=f"Authentication failed: {e}"
         )
 
-    user_info = await oauth.google.parse_id_token(request, token)
-    user_data = {"email": user_info['email'], "name": user_info.get('name', 'N/A'), "google_id": user_info['sub']}
-    access_token = create_access_token(data=user_data, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    # authorize_access_token has already verified Google's ID token and parsed its claims
+    user_info = token.get("userinfo")
+    if user_info is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Authentication failed: no ID token returned")
+    user_data = {"sub": user_info['sub'], "email": user_info['email'], "name": user_info.get('name', 'N/A')}
+    session_id = create_session(user_data)
     response = RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
-    response.set_cookie(key="access_token", value=access_token, httponly=True, max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    response.set_cookie(key="session_id", value=session_id, httponly=True, secure=True, samesite="lax", max_age=int(_ACCESS_EXPIRY.total_seconds()))
     return response
 
-@app.get("/google-protected-data")
-async def get_google_protected_data(request: Request):
-    access_token = request.cookies.get("access_token")
-    if not access_token:
+@app.get("/auth/token")
+def issue_access_token(session_id: Optional[str] = Depends(session_cookie)) -> AccessToken:
+    """
+    Exchanges the browser session for an internal JWT, for callers that use
+    "Authorization: Bearer" instead of cookies.
+    """
+    with _sessions_lock:
+        user = _sessions.get(session_id) if session_id else None
+    if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    access_token = create_access_token(sub=user["sub"], email=user["email"], name=user["name"], expires_delta=_ACCESS_EXPIRY)
+    return AccessToken(access_token=access_token)
 
+@app.get("/google-protected-data")
+def get_google_protected_data(user: dict = Depends(get_current_user)) -> GoogleProtectedData:
     try:
-        payload = jwt.decode(access_token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("email")
-        user_name = payload.get("name")
-        google_id = payload.get("google_id")
-        if user_email is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        user_email, user_name, google_id = user["email"], user.get("name", "N/A"), user["sub"]
+    except KeyError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
 
-    return {"message": f"Hello, {user_name} ({user_email})! This is Google-protected data.", "google_id": google_id}
+    return GoogleProtectedData(message=f"Hello, {user_name} ({user_email})! This is Google-protected data.", google_id=google_id)
 
 
 # --- Azure AD Protected Endpoint ---
-@app.get("/azure-protected-data")
-@requires_auth # This decorator from fastapi-microsoft-identity handles token validation
-async def get_azure_protected_data(request: Request):
+azure_bearer = HTTPBearer()
+
+def _has_scope(claims: dict, required_scope: str) -> bool:
+    # App permissions arrive as a "roles" array, delegated scopes as a space-delimited "scp" string
+    granted = claims.get("roles") or claims.get("scp", "").split()
+    return required_scope.lower() in (scope.lower() for scope in granted)
+
+def verify_azure(token: HTTPAuthorizationCredentials = Depends(azure_bearer)) -> dict:
     """
-    An example endpoint protected by Azure AD.
-    Expects a Bearer token in the Authorization header issued by Azure AD.
+    Validates an Azure AD bearer token and returns its claims.
+    Signature, audience, issuer and expiry are checked locally against the cached JWKS,
+    with the issuer and audience both taken from the pair for the token's "ver" claim;
+    tokens already validated are served from the token cache.
     """
-    try:
-        # Optionally validate specific scopes
-        validate_scope(AZURE_SCOPE, request)
-        
-        # Access token claims after successful validation
-        # The claims are available in request.state.user
-        claims = request.state.user
-        user_name = claims.get("name", "N/A")
-        user_email = claims.get("preferred_username", "N/A") # Or 'email'
-        tenant_id = claims.get("tid", "N/A")
-
-        return {
-            "message": f"Hello, {user_name} ({user_email})! This is Azure AD-protected data.",
-            "tenant_id": tenant_id,
-            "claims": claims # For debugging, shows all claims
-        }
-    except AuthError as e:
-        # fastapi-microsoft-identity raises AuthError for auth/authz issues
+    key = _token_cache_key(token.credentials)
+    with _azure_claims_cache_lock:
+        claims = _azure_claims_cache.get(key)
+    if claims is None:
+        try:
+            version = jwt.decode(token.credentials, options={"verify_signature": False}).get("ver")
+            if version not in AZURE_TOKEN_VERSIONS:
+                raise jwt.InvalidTokenError(f"Unsupported token version: {version}")
+            issuer, audience = AZURE_TOKEN_VERSIONS[version]
+            signing_key = _jwks_client.get_signing_key_from_jwt(token.credentials)
+            claims = jwt.decode(
+                token.credentials,
+                signing_key.key,
+                algorithms=["RS256"],
+                audience=audience,
+                issuer=issuer,
+            )
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired", headers={"WWW-Authenticate": "Bearer"})
+        except (PyJWKClientError, jwt.InvalidTokenError) as e:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Invalid token: {e}", headers={"WWW-Authenticate": "Bearer"})
+        with _azure_claims_cache_lock:
+            _azure_claims_cache[key] = claims
+
+    if not _has_scope(claims, settings.azure_scope):
         raise HTTPException(
-            status_code=e.status_code,
-            detail=e.detail,
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f'The "scp" or "roles" claim does not contain {settings.azure_scope}',
             headers={"WWW-Authenticate": "Bearer"}
         )
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
-
-@app.get("/", response_class=HTMLResponse)
-async def home():
-    return """
-    <html>
-        <head>
-            <title>FastAPI OAuth</title>
-        </head>
-        <body>
-            <h1>Welcome to FastAPI OAuth Demo</h1>
-            <p><a href="/auth/google/login">Login with Google</a></p>
-            <p>For Azure AD, you'd typically have a client application (e.g., SPA) that acquires the token and sends it to this API.
-            <br>
-            If you want to test the Azure AD protected endpoint, you can use a tool like Postman or fetch an access token from Azure AD
-            and include it in the 'Authorization: Bearer YOUR_AZURE_AD_TOKEN' header when calling '/azure-protected-data'.
-            </p>
-            <p><a href="/google-protected-data">Access Google Protected Data (after Google login)</a></p>
-            <p><a href="/azure-protected-data">Access Azure Protected Data (needs Azure AD Bearer Token)</a></p>
-        </body>
-    </html>
+    return claims
+
+@app.get("/azure-protected-data")
+def get_azure_protected_data(claims: dict = Depends(verify_azure)) -> AzureProtectedData:
     """
+    An example endpoint protected by Azure AD.
+    Expects a Bearer token in the Authorization header issued by Azure AD.
+    """
+    user_name = claims.get("name", "N/A")
+    user_email = claims.get("preferred_username", "N/A") # Or 'email'
+    tenant_id = claims.get("tid", "N/A")
+
+    return AzureProtectedData(
+        message=f"Hello, {user_name} ({user_email})! This is Azure AD-protected data.",
+        tenant_id=tenant_id,
+        claims=claims,
+    )
+
+# The landing page is static HTML. In production a reverse proxy serves it without reaching
+# Python (see deploy/nginx.conf); for local development it is mounted here with the same
+# Cache-Control. Mounted last so the API routes above take precedence.
+app.mount("/", CachedStaticFiles(directory=Path(__file__).parent / "static" / "azure_main", html=True), name="static")
 
 if __name__ == "__main__":
     import uvicorn
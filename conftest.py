@@ -0,0 +1,10 @@
+import os
+
+# Settings() is read at import time; give the required values defaults so the app
+# modules can be imported without a .env file
+os.environ.setdefault("GOOGLE_CLIENT_ID", "test-client-id")
+os.environ.setdefault("GOOGLE_CLIENT_SECRET", "test-client-secret")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret-key-at-least-32-bytes")
+os.environ.setdefault("AZURE_TENANT_ID", "test-tenant-id")
+os.environ.setdefault("AZURE_CLIENT_ID", "test-api-client-id")
+os.environ.setdefault("AZURE_SCOPE", "access_as_user")
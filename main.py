@@ -1,60 +1,193 @@
-import os
-from datetime import datetime, timedelta
+import hashlib
+import secrets
+from contextlib import asynccontextmanager
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 from typing import Optional
 
 from fastapi import FastAPI, Depends, HTTPException, status, Request
-from fastapi.responses import RedirectResponse, HTMLResponse
-from fastapi.security import OAuth2PasswordBearer
-from starlette.middleware.sessions import SessionMiddleware
+from fastapi.responses import RedirectResponse
+from fastapi.security import APIKeyCookie, OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
 from authlib.integrations.starlette_client import OAuth
-from jose import jwt, JWSAlgorithms
+from cachetools import TLRUCache, TTLCache
+import httpx
+import jwt
+import orjson
+from pydantic import BaseModel, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
-from dotenv import load_dotenv
+from signing import FastSessionMiddleware, b64url, hs256
+from static_files import CachedStaticFiles
 
-load_dotenv()
+# --- Configuration ---
+# Read from the environment (or .env) once at import; a missing or empty required value
+# fails at startup instead of surfacing as a None or "" in the middle of a request.
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore", frozen=True)
+
+    google_client_id: str = Field(min_length=1)
+    google_client_secret: str = Field(min_length=1)
+    jwt_secret_key: str = Field(min_length=32) # For your internal JWTs; HS256 wants at least 32 bytes
+    session_secret_key: str = Field(default="another-secret-key", min_length=1)
+    access_token_expire: timedelta = timedelta(minutes=30)
+
+settings = Settings()
 
-# --- Configuration for Google OAuth ---
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 GOOGLE_REDIRECT_URI = "http://localhost:8000/auth/google/callback" # Must match your Google Cloud Console setting
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-super-secret-key") # For your internal JWTs
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+_DEFAULT_EXPIRY = timedelta(minutes=15)
+_ACCESS_EXPIRY = settings.access_token_expire
 
 # --- FastAPI App Setup ---
+async def _prime_google_metadata():
+    # Authlib keeps the OpenID configuration and signing keys for the life of the process
+    # once loaded, so fetching them here takes the discovery round-trip off the first login.
+    try:
+        await oauth.google.load_server_metadata()
+        await oauth.google.fetch_jwk_set()
+    except Exception as e:
+        print(f"Warning: could not preload Google OpenID metadata, it will be fetched on first login. Error: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.http_transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+    await _prime_google_metadata()
+    yield
+    await app.state.http_transport.aclose()
+
 app = FastAPI(
     title="FastAPI OAuth Integrations",
     description="Example for Google and Azure AD authentication",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
-# Session middleware is required for Authlib's OAuth client
-app.add_middleware(SessionMiddleware, secret_key=os.getenv("SESSION_SECRET_KEY", "another-secret-key"))
+# Session middleware is required for Authlib's OAuth client; it only carries OAuth state,
+# so a short lifetime is enough
+app.add_middleware(FastSessionMiddleware, secret_key=settings.session_secret_key, max_age=600)
+
+class AppTransport(httpx.AsyncBaseTransport):
+    """
+    Sends requests through the app-wide HTTP/2 connection pool in app.state.http_transport.
+    Authlib opens and closes a client for every OAuth call; closing this transport is a no-op,
+    so TLS sessions and keep-alive connections survive across logins.
+    """
+    def __init__(self, app: FastAPI):
+        self.app = app
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.app.state.http_transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
 
 oauth = OAuth()
 oauth.register(
     name='google',
-    client_id=GOOGLE_CLIENT_ID,
-    client_secret=GOOGLE_CLIENT_SECRET,
+    client_id=settings.google_client_id,
+    client_secret=settings.google_client_secret,
     server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={'scope': 'openid email profile'},
+    client_kwargs={'scope': 'openid email profile', 'transport': AppTransport(app), 'timeout': 5.0},
 )
 
 # --- Internal JWT for authenticated users (after Google login) ---
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token") # This tokenUrl is for your API's internal token endpoint, if you had one.
                                                       # For external OAuth, we will issue a token upon successful login.
+# Browsers authenticate with the session_id cookie, API callers with an internal JWT bearer token
+session_cookie = APIKeyCookie(name="session_id", auto_error=False)
+internal_bearer = HTTPBearer(scheme_name="InternalBearer", auto_error=False)
+
+# The header of every internal token is the same, so it is serialized and encoded once
+_JWT_HEADER_B64 = b64url(b'{"alg":"HS256","typ":"JWT"}')
 
 # Function to create an internal JWT token
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(datetime.timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(datetime.timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+def create_access_token(*, sub: str, email: str, name: str, expires_delta: timedelta = _DEFAULT_EXPIRY) -> str:
+    expire = datetime.now(timezone.utc) + expires_delta
+    payload = {"sub": sub, "email": email, "name": name, "exp": int(expire.timestamp())}
+    # Equivalent to jwt.encode, without re-serializing the constant header on every token
+    signing_input = _JWT_HEADER_B64 + b"." + b64url(orjson.dumps(payload))
+    signature = hs256.sign(signing_input, hs256.prepare_key(settings.jwt_secret_key))
+    return (signing_input + b"." + b64url(signature)).decode("ascii")
+
+# --- Server-side sessions ---
+# Browsers get an opaque session_id cookie that maps to the user in this in-process cache,
+# so authenticating a page load is a dict lookup with no token to verify. Run a single
+# worker, or move the cache to a shared store such as Redis, if you scale out.
+_sessions = TTLCache(maxsize=10_000, ttl=_ACCESS_EXPIRY.total_seconds())
+_sessions_lock = threading.Lock()
+
+def create_session(user_data: dict) -> str:
+    session_id = secrets.token_urlsafe(32)
+    with _sessions_lock:
+        _sessions[session_id] = {**user_data, "exp": int(time.time() + _ACCESS_EXPIRY.total_seconds())}
+    return session_id
+
+# --- Verified token cache ---
+# Decoded payloads are kept for repeat requests from the same session, keyed by a
+# SHA-256 prefix of the token so raw tokens never sit in memory. Entries live no
+# longer than the token's own "exp" claim, and at most TOKEN_CACHE_MAX_TTL seconds.
+TOKEN_CACHE_MAX_TTL = 60
+
+def _token_cache_ttu(_key, payload, now):
+    return min(payload.get("exp", now), now + TOKEN_CACHE_MAX_TTL)
+
+_internal_token_cache = TLRUCache(maxsize=10000, ttu=_token_cache_ttu, timer=time.time)
+_internal_token_cache_lock = threading.Lock() # sync dependencies run in the threadpool
+
+def _token_cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+def decode_access_token(access_token: str) -> dict:
+    key = _token_cache_key(access_token)
+    with _internal_token_cache_lock:
+        payload = _internal_token_cache.get(key)
+    if payload is None:
+        payload = jwt.decode(access_token, settings.jwt_secret_key, algorithms=[ALGORITHM])
+        with _internal_token_cache_lock:
+            _internal_token_cache[key] = payload
+    return payload
+
+def get_current_user(
+    session_id: Optional[str] = Depends(session_cookie),
+    bearer: Optional[HTTPAuthorizationCredentials] = Depends(internal_bearer),
+) -> dict:
+    """
+    Resolves the user from the session_id cookie, or from an internal JWT sent as
+    "Authorization: Bearer" by API-style callers.
+    FastAPI caches dependency results per request, so every dependant shares one lookup.
+    """
+    if session_id:
+        with _sessions_lock:
+            user = _sessions.get(session_id)
+        if user is not None:
+            return user
+    if bearer is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+    try:
+        payload = decode_access_token(bearer.credentials)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    return payload
+
+# --- Response models ---
+# Declaring return types lets FastAPI serialize responses straight to JSON bytes with
+# pydantic-core instead of going through jsonable_encoder and the stdlib json module.
+class AccessToken(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+
+class GoogleProtectedData(BaseModel):
+    message: str
+    google_id: Optional[str] = None
 
 # --- Google OAuth Endpoints ---
 @app.get("/auth/google/login")
@@ -77,65 +210,57 @@ async def auth_google_callback(request: Request):
             detail=f"Authentication failed: {e}"
         )
 
-    user_info = await oauth.google.parse_id_token(request, token)
+    # authorize_access_token has already verified Google's ID token and parsed its claims
+    user_info = token.get("userinfo")
+    if user_info is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Authentication failed: no ID token returned")
 
-    # Here, user_info contains user details from Google (e.g., 'email', 'name', 'sub')
+    # Here, user_info contains the verified ID token claims from Google (e.g., 'email', 'name', 'sub')
     # You would typically:
     # 1. Look up the user in your database based on their Google ID (user_info['sub'] or 'email').
     # 2. If the user doesn't exist, create a new user record.
-    # 3. Create an internal JWT for your application's session.
+    # 3. Create a session for your application.
 
-    # For demonstration, we'll just create a simple JWT
-    user_data = {"email": user_info['email'], "name": user_info.get('name', 'N/A'), "google_id": user_info['sub']}
-    access_token = create_access_token(data=user_data, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    # For demonstration, we'll just keep the user in an in-memory session
+    user_data = {"sub": user_info['sub'], "email": user_info['email'], "name": user_info.get('name', 'N/A')}
+    session_id = create_session(user_data)
 
-    # Redirect to a frontend page or return the token directly (e.g., for SPA)
-    # For a real application, you'd typically redirect to your frontend with the token
-    # or set it in a secure cookie.
+    # Redirect to a frontend page; the browser now carries only an opaque session ID.
+    # API-style clients can exchange it for an internal JWT at /auth/token.
     response = RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
-    response.set_cookie(key="access_token", value=access_token, httponly=True, max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    response.set_cookie(key="session_id", value=session_id, httponly=True, secure=True, samesite="lax", max_age=int(_ACCESS_EXPIRY.total_seconds()))
     return response
 
-@app.get("/google-protected-data")
-async def get_google_protected_data(request: Request):
+@app.get("/auth/token")
+def issue_access_token(session_id: Optional[str] = Depends(session_cookie)) -> AccessToken:
     """
-    An example protected endpoint.
-    Checks for the internal access_token cookie.
+    Exchanges the browser session for an internal JWT, for callers that use
+    "Authorization: Bearer" instead of cookies.
     """
-    access_token = request.cookies.get("access_token")
-    if not access_token:
+    with _sessions_lock:
+        user = _sessions.get(session_id) if session_id else None
+    if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    access_token = create_access_token(sub=user["sub"], email=user["email"], name=user["name"], expires_delta=_ACCESS_EXPIRY)
+    return AccessToken(access_token=access_token)
 
+@app.get("/google-protected-data")
+def get_google_protected_data(user: dict = Depends(get_current_user)) -> GoogleProtectedData:
+    """
+    An example protected endpoint.
+    Accepts the session_id cookie or an internal JWT bearer token.
+    """
     try:
-        payload = jwt.decode(access_token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("email")
-        user_name = payload.get("name")
-        google_id = payload.get("google_id")
-        if user_email is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        user_email, user_name, google_id = user["email"], user.get("name", "N/A"), user["sub"]
+    except KeyError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
 
-    return {"message": f"Hello, {user_name} ({user_email})! This is Google-protected data.", "google_id": google_id}
-
-@app.get("/", response_class=HTMLResponse)
-async def home():
-    return """
-    <html>
-        <head>
-            <title>FastAPI OAuth</title>
-        </head>
-        <body>
-            <h1>Welcome to FastAPI OAuth Demo</h1>
-            <p><a href="/auth/google/login">Login with Google</a></p>
-            <p><a href="/auth/azure/login">Login with Azure AD</a></p>
-            <p><a href="/google-protected-data">Access Google Protected Data (after Google login)</a></p>
-            <p><a href="/azure-protected-data">Access Azure Protected Data (after Azure login)</a></p>
-        </body>
-    </html>
-    """
+    return GoogleProtectedData(message=f"Hello, {user_name} ({user_email})! This is Google-protected data.", google_id=google_id)
+
+# The landing page is static HTML. In production a reverse proxy serves it without reaching
+# Python (see deploy/nginx.conf); for local development it is mounted here with the same
+# Cache-Control. Mounted last so the API routes above take precedence.
+app.mount("/", CachedStaticFiles(directory=Path(__file__).parent / "static" / "main", html=True), name="static")
 
 if __name__ == "__main__":
     import uvicorn
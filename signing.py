@@ -0,0 +1,104 @@
+import base64
+import hashlib
+import hmac
+import time
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+import jwt
+import orjson
+from jwt.algorithms import HMACAlgorithm
+from starlette.datastructures import MutableHeaders
+from starlette.middleware.sessions import Session, SessionMiddleware
+from starlette.requests import HTTPConnection
+from starlette.types import Message, Receive, Scope, Send
+
+# --- HMAC signing (internal JWTs and session cookies) ---
+# Shared by main.py and azure_main.py, so PyJWT's HS256 is replaced exactly once per process.
+# HS256 with the HMAC key schedule computed once per secret. prepare_key keeps the keyed
+# HMAC object (inner and outer pad states already absorbed), so each token only clones it
+# instead of re-validating the secret and compressing the padded key block again.
+class _PrekeyedHMAC(NamedTuple):
+    mac: hmac.HMAC
+    length_msg: Optional[str]
+
+class PrekeyedHS256(HMACAlgorithm):
+    def __init__(self):
+        super().__init__(HMACAlgorithm.SHA256)
+
+    @lru_cache(maxsize=8)
+    def prepare_key(self, key) -> _PrekeyedHMAC:
+        key_bytes = super().prepare_key(key)
+        return _PrekeyedHMAC(hmac.new(key_bytes, digestmod=hashlib.sha256), super().check_key_length(key_bytes))
+
+    def check_key_length(self, key: _PrekeyedHMAC) -> Optional[str]:
+        return key.length_msg
+
+    def sign(self, msg: bytes, key: _PrekeyedHMAC) -> bytes:
+        mac = key.mac.copy()
+        mac.update(msg)
+        return mac.digest()
+
+hs256 = PrekeyedHS256()
+jwt.unregister_algorithm("HS256")
+jwt.register_algorithm("HS256", hs256)
+
+def b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+def b64url_decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+# --- Session cookies ---
+class FastSessionMiddleware(SessionMiddleware):
+    """
+    Starlette's SessionMiddleware with orjson serialization and a signature computed from
+    the pre-keyed HMAC state above, instead of stdlib json and itsdangerous.
+    Cookies have the form base64url(session).timestamp.base64url(hmac).
+    """
+    def __init__(self, app, secret_key: str, **kwargs):
+        super().__init__(app, secret_key=secret_key, **kwargs)
+        self._key = hs256.prepare_key(secret_key)
+
+    def _sign(self, session: dict) -> bytes:
+        value = b64url(orjson.dumps(session)) + b"." + str(int(time.time())).encode()
+        return value + b"." + b64url(hs256.sign(value, self._key))
+
+    def _unsign(self, cookie: bytes) -> Optional[dict]:
+        value, _, signature = cookie.rpartition(b".")
+        data, _, timestamp = value.partition(b".")
+        try:
+            if not hs256.verify(value, self._key, b64url_decode(signature)):
+                return None
+            if self.max_age and time.time() - int(timestamp) > self.max_age:
+                return None
+            return orjson.loads(b64url_decode(data))
+        except ValueError:
+            return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        initial_session = None
+        if self.session_cookie in connection.cookies:
+            initial_session = self._unsign(connection.cookies[self.session_cookie].encode("ascii", "replace"))
+        scope["session"] = Session(initial_session or {})
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                session: Session = scope["session"]
+                headers = MutableHeaders(scope=message)
+                if session.accessed:
+                    headers.add_vary_header("Cookie")
+                if session.modified and session:
+                    max_age = f"Max-Age={self.max_age}; " if self.max_age else ""
+                    headers.append("Set-Cookie", f"{self.session_cookie}={self._sign(session).decode('ascii')}; path={self.path}; {max_age}{self.security_flags}")
+                elif session.modified and initial_session is not None:
+                    # The session has been cleared
+                    headers.append("Set-Cookie", f"{self.session_cookie}=null; path={self.path}; expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.security_flags}")
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,17 @@
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+# --- Static landing pages ---
+# Shared by main.py and azure_main.py. Matches the "expires 1h" in deploy/nginx.conf, so
+# browsers may skip repeat requests whether or not the proxy is in front.
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles that also sends Cache-Control (public, max-age=3600) besides ETag and Last-Modified.
+    """
+    cache_control = "public, max-age=3600"
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["cache-control"] = self.cache_control
+        return response
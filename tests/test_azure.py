@@ -0,0 +1,88 @@
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi.testclient import TestClient
+
+import azure_main
+
+_private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+V2_CLAIMS = {
+    "ver": "2.0",
+    "iss": f"https://login.microsoftonline.com/{azure_main.settings.azure_tenant_id}/v2.0",
+    "aud": azure_main.settings.azure_client_id,
+}
+
+
+class _SigningKey:
+    key = _private_key.public_key()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(azure_main._jwks_client, "get_signing_key_from_jwt", lambda token: _SigningKey)
+    return TestClient(azure_main.app)
+
+
+def azure_token(**claims) -> str:
+    claims = {"exp": int(time.time()) + 300, "scp": azure_main.settings.azure_scope, **claims}
+    return jwt.encode(claims, _private_key, algorithm="RS256")
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_azure_token_is_not_accepted_as_internal_jwt(client):
+    # sub/email/name make the claims look like an internal payload to /google-protected-data
+    token = azure_token(**V2_CLAIMS, sub="42", email="ann@example.com", name="Ann")
+    assert client.get("/azure-protected-data", headers=bearer(token)).status_code == 200
+    # The Azure AD claims are now cached; the internal JWT path must still verify on its own
+    response = client.get("/google-protected-data", headers=bearer(token))
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Invalid token"}
+
+
+V1_CLAIMS = {
+    "ver": "1.0",
+    "iss": f"https://sts.windows.net/{azure_main.settings.azure_tenant_id}/",
+    "aud": f"api://{azure_main.settings.azure_client_id}",
+}
+
+
+@pytest.mark.parametrize("claims", [V2_CLAIMS, V1_CLAIMS], ids=["v2.0", "v1.0"])
+def test_token_version_is_accepted(client, claims):
+    response = client.get("/azure-protected-data", headers=bearer(azure_token(**claims)))
+    assert response.status_code == 200
+    assert response.json()["claims"]["ver"] == claims["ver"]
+
+
+@pytest.mark.parametrize("claims", [
+    {**V1_CLAIMS, "aud": V2_CLAIMS["aud"]},
+    {**V2_CLAIMS, "aud": V1_CLAIMS["aud"]},
+    {**V1_CLAIMS, "iss": V2_CLAIMS["iss"]},
+    {**V2_CLAIMS, "iss": V1_CLAIMS["iss"]},
+], ids=["v1-iss-v2-aud", "v2-iss-v1-aud", "v1-aud-v2-iss", "v2-aud-v1-iss"])
+def test_mixed_issuer_and_audience_is_rejected(client, claims):
+    assert client.get("/azure-protected-data", headers=bearer(azure_token(**claims))).status_code == 401
+
+
+def test_missing_version_is_rejected(client):
+    claims = {key: value for key, value in V1_CLAIMS.items() if key != "ver"}
+    response = client.get("/azure-protected-data", headers=bearer(azure_token(**claims)))
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Invalid token: Unsupported token version: None"}
+
+
+def test_missing_scope_is_forbidden(client):
+    response = client.get("/azure-protected-data", headers=bearer(azure_token(**V2_CLAIMS, scp="other")))
+    assert response.status_code == 403
+
+
+def test_expired_token_is_rejected(client):
+    token = azure_token(**V2_CLAIMS, exp=int(time.time()) - 60)
+    response = client.get("/azure-protected-data", headers=bearer(token))
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Token expired"}
@@ -0,0 +1,80 @@
+import orjson
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import signing
+from signing import FastSessionMiddleware, b64url
+
+SECRET = "test-session-secret"
+
+app = FastAPI()
+app.add_middleware(FastSessionMiddleware, secret_key=SECRET, max_age=600)
+
+
+@app.get("/set")
+def set_session(request: Request):
+    request.session["user"] = "ann"
+    return {}
+
+
+@app.get("/get")
+def get_session(request: Request):
+    return dict(request.session)
+
+
+@app.get("/clear")
+def clear_session(request: Request):
+    request.session.clear()
+    return {}
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def middleware():
+    return FastSessionMiddleware(app, secret_key=SECRET, max_age=600)
+
+
+def test_round_trip(client):
+    client.get("/set")
+    assert client.get("/get").json() == {"user": "ann"}
+
+
+def test_sign_unsign(middleware):
+    assert middleware._unsign(middleware._sign({"user": "ann"})) == {"user": "ann"}
+
+
+def test_tampered_session_is_rejected(client, middleware):
+    _, timestamp, signature = middleware._sign({"user": "ann"}).split(b".")
+    forged = b64url(orjson.dumps({"user": "admin"})) + b"." + timestamp + b"." + signature
+    assert middleware._unsign(forged) is None
+
+    client.cookies.set("session", forged.decode())
+    assert client.get("/get").json() == {}
+
+
+def test_bad_base64_is_rejected(client, middleware):
+    assert middleware._unsign(b"not-base64!.123.%%%") is None
+    assert middleware._unsign(b"garbage") is None
+
+    client.cookies.set("session", "garbage")
+    assert client.get("/get").json() == {}
+
+
+def test_expired_timestamp_is_rejected(monkeypatch, middleware):
+    cookie = middleware._sign({"user": "ann"})
+    now = signing.time.time()
+    monkeypatch.setattr(signing.time, "time", lambda: now + 601)
+    assert middleware._unsign(cookie) is None
+
+
+def test_clear_expires_cookie(client):
+    client.get("/set")
+    response = client.get("/clear")
+    set_cookie = response.headers["set-cookie"]
+    assert set_cookie.startswith("session=null; path=/;")
+    assert "expires=Thu, 01 Jan 1970 00:00:00 GMT" in set_cookie
@@ -0,0 +1,24 @@
+import pytest
+from pydantic import ValidationError
+
+import azure_main
+import main
+
+
+@pytest.mark.parametrize("module", [main, azure_main])
+@pytest.mark.parametrize("name, value", [
+    ("GOOGLE_CLIENT_ID", ""),
+    ("GOOGLE_CLIENT_SECRET", ""),
+    ("JWT_SECRET_KEY", ""),
+    ("JWT_SECRET_KEY", "too-short"),
+    ("SESSION_SECRET_KEY", ""),
+])
+def test_empty_or_weak_secret_is_rejected(monkeypatch, module, name, value):
+    monkeypatch.setenv(name, value)
+    with pytest.raises(ValidationError):
+        module.Settings(_env_file=None)
+
+
+@pytest.mark.parametrize("module", [main, azure_main])
+def test_settings_load_from_environment(module):
+    assert module.Settings(_env_file=None).jwt_secret_key
@@ -0,0 +1,24 @@
+import jwt
+from jwt.algorithms import HMACAlgorithm
+
+import main
+from signing import b64url_decode, hs256
+
+
+def test_hs256_is_registered():
+    assert jwt.get_algorithm_by_name("HS256") is hs256
+
+
+def test_access_token_matches_stock_hs256():
+    token = main.create_access_token(sub="42", email="ann@example.com", name="Ann")
+    signing_input, _, signature = token.encode("ascii").rpartition(b".")
+
+    stock = HMACAlgorithm(HMACAlgorithm.SHA256)
+    key = stock.prepare_key(main.settings.jwt_secret_key)
+    assert stock.verify(signing_input, key, b64url_decode(signature))
+    assert b64url_decode(signature) == stock.sign(signing_input, key)
+
+    # A fresh PyJWS carries PyJWT's default algorithms, not the registered PrekeyedHS256
+    stock_jws = jwt.PyJWS()
+    payload = stock_jws.decode(token, main.settings.jwt_secret_key, algorithms=["HS256"])
+    assert stock_jws.encode(payload, main.settings.jwt_secret_key, algorithm="HS256") == token
@@ -0,0 +1,14 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import azure_main
+import main
+
+
+@pytest.mark.parametrize("module", [main, azure_main])
+def test_landing_page_is_cacheable(module):
+    response = TestClient(module.app).get("/")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/html")
+    assert response.headers["cache-control"] == "public, max-age=3600"
+    assert "etag" in response.headers